@@ -22,15 +22,16 @@ The app expects the following structure in the Excel files:
    - ``رقم إقامة رب الأسرة`` – the iqama number of the head of household (employee).
    - one row per dependent.
 
-3. **Monthly report PDF** – optional. If provided, the app uses ``pdfplumber`` to extract the
-   contract documentation rate (معدل توثيق العقود) and the Saudisation rate (معدل التوطين).
+3. **Monthly report PDF** – optional. If provided, the app uses ``pypdfium2`` (falling back to
+   ``pdfplumber``) to extract the contract documentation rate (معدل توثيق العقود) and the
+   Saudisation rate (معدل التوطين).
    The PDF must contain these Arabic phrases followed by the percentage values. If the text
    extraction fails, the app will ask the user to enter the values manually.
 
 To run the app in Google Colab you can execute the following in a cell:
 
 ```python
-!pip install streamlit pdfplumber
+!pip install streamlit pypdfium2 pdfplumber
 !streamlit run dashboard_arabic.py --server.port 8501 --server.address 0.0.0.0
 ```
 
@@ -40,10 +41,23 @@ Streamlit will provide a public URL when run inside Colab. Open that URL to view
 
 import io
 import re
-from typing import Optional, Tuple
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+# python-calamine is a Rust-backed xlsx reader that pandas (>= 2.2) can use as an engine.  It
+# is much faster than openpyxl for full sheet reads, so prefer it when installed.  Header
+# detection keeps using openpyxl's read-only mode, which is already cheap for one row.
+try:
+    import python_calamine  # type: ignore  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 # Matplotlib is no longer required for charting (we use Plotly instead), but we
 # import it conditionally in case other parts of the code or future expansions
 # rely on it.  If it is not installed, charts will still function via Plotly.
@@ -54,12 +68,7 @@ except ImportError:
 # Plotly is used for interactive charts with hover support.  It provides a richer
 # user experience compared to Matplotlib and handles right‑to‑left text better.
 import plotly.express as px
-
-# Attempt to import pdfplumber for PDF parsing; fall back gracefully if unavailable
-try:
-    import pdfplumber  # type: ignore
-except ImportError:
-    pdfplumber = None  # pdfplumber will be None if not installed
+import plotly.graph_objects as go
 
 # Arabic text rendering helpers
 # Matplotlib does not support proper Arabic shaping and right‑to‑left rendering out of the box.  To
@@ -77,13 +86,97 @@ except ImportError:
         return text
 
 
+class WorkbookError(ValueError):
+    """Raised when an uploaded workbook lacks a sheet or column the dashboard needs."""
+
+
+# Map Arabic contract statuses to English for chart labels
+STATUS_MAP = {
+    'محدد': 'Limited',
+    'غير محدد': 'Unlimited'
+}
+
+# Number of nationalities shown individually in the distribution chart; the rest are
+# grouped into a single "Other" bar
+NATIONALITY_CHART_TOP_N = 15
+
+# Phrases that introduce the two rates in the monthly report PDF
+SAUDISATION_PHRASE = "معدل التوطين"
+CONTRACT_DOC_PHRASE = "معدل توثيق العقود"
+
+# Pattern used when scanning PDF text, compiled once at import time.  It matches either
+# phrase and captures the first percentage within ~45 characters after it.  Words inside a
+# phrase may be separated by any run of whitespace (including line breaks), and within the
+# window a whitespace run of any length counts as a single character, as if the text had
+# been whitespace-normalised.  The raw page text can therefore be searched directly without
+# building a normalised copy; the ``(?!\s)`` keeps each run atomic so backtracking stays
+# linear.  The percentage sits in a look-ahead so only the phrase is consumed, and a rate
+# phrase that falls inside the other phrase's window is still found.
+_RATES_RE = re.compile(
+    "(?:(?P<saudisation>" + r"\s+".join(map(re.escape, SAUDISATION_PHRASE.split())) + ")"
+    + "|(?P<contract_doc>" + r"\s+".join(map(re.escape, CONTRACT_DOC_PHRASE.split())) + "))"
+    + r"(?=(?:\S|\s+(?!\s)){0,45}?(?P<rate>[0-9٠-٩]+)\s*%)"
+)
+# Word both phrases start with; candidate positions are located with str.find
+_RATE_PREFIX = "معدل"
+# Translation table from Arabic-Indic digits to Western digits
+_AR2EN = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+# PDFium is not thread-safe: no two threads may call into it at once, even on different
+# documents.  Streamlit runs each session's script in its own thread, so every pypdfium2
+# call goes through this lock.
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _iter_pdf_text(file: io.BytesIO) -> Iterator[str]:
+    """Yield the plain text of each page of a PDF, one page at a time.
+
+    Uses ``pypdfium2`` when installed and ``pdfplumber`` otherwise.  Pages are
+    extracted lazily so callers can stop early without reading the whole document.
+
+    pypdfium2 wraps PDFium's native text extractor and is much faster than pdfplumber,
+    which builds a full character-level layout model per page.  Both are imported here
+    rather than at module load so sessions that never upload a PDF don't pay for them;
+    ``ImportError`` is raised if neither is installed.
+
+    PDFium must not be entered from two threads at once, so the pypdfium2 path holds a
+    module-level lock from opening the document until it is closed.  Concurrent sessions
+    parsing PDFs are therefore serialised on purpose.  The lock is held across ``yield``,
+    so callers should close the generator promptly (e.g. with ``contextlib.closing``)
+    when they stop early.
+    """
+    try:
+        import pypdfium2 as pdfium  # type: ignore
+    except ImportError:
+        pdfium = None  # pypdfium2 will be None if not installed
+    if pdfium is not None:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(file)
+            try:
+                for i in range(len(pdf)):
+                    page = pdf[i]
+                    textpage = page.get_textpage()
+                    try:
+                        yield textpage.get_text_range()
+                    finally:
+                        textpage.close()
+                        page.close()
+            finally:
+                pdf.close()
+    else:
+        import pdfplumber  # type: ignore
+
+        with pdfplumber.open(file) as pdf:
+            for page in pdf.pages:
+                yield page.extract_text() or ""
+
 
 def extract_pdf_metrics(file: io.BytesIO) -> Tuple[Optional[str], Optional[str]]:
     """Extract Saudisation and contract documentation rates from a PDF.
 
     This function attempts to locate the phrases ``معدل التوطين`` and ``معدل توثيق العقود``
     in the PDF text and then extract the first percentage value that appears nearby.
-    It normalizes whitespace and searches within a fixed window after the phrase.
+    It scans each page once for both phrases, tolerating any whitespace between their
+    words, and looks for the percentage within a fixed window after each one.
 
     Parameters
     ----------
@@ -96,46 +189,305 @@ def extract_pdf_metrics(file: io.BytesIO) -> Tuple[Optional[str], Optional[str]]
         ``(saudisation_rate, contract_doc_rate)`` where each value is a string
         including the percent sign (e.g., ``"75%"``) or ``None`` if not found.
     """
-    if pdfplumber is None:
-        # PDF extraction library not installed
-        return None, None
+    # A missing PDF extraction library surfaces as ImportError from _iter_pdf_text
+    # and is handled like any other extraction failure below
     try:
         saudisation_rate: Optional[str] = None
         contract_doc_rate: Optional[str] = None
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
+        # closing() releases the PDFium lock as soon as the loop breaks out early
+        with closing(_iter_pdf_text(file)) as pages:
+            for text in pages:
                 if not text:
                     continue
-                # Normalize whitespace to single spaces
-                text = re.sub(r"\s+", " ", text)
-                # Search for Saudisation phrase and extract first percentage afterwards
-                idx_saud = text.find("معدل التوطين")
-                if idx_saud != -1 and saudisation_rate is None:
-                    window = text[idx_saud:idx_saud + 60]  # look ahead 60 characters
-                    m = re.search(r"([0-9٠-٩]+)\s*%", window)
+                # Both phrases start with the same word, so jump between its occurrences with
+                # the C-level str.find and only run the regex anchored at those positions.
+                # Most pages contain neither phrase and fall through after a single find.
+                idx = text.find(_RATE_PREFIX)
+                while idx != -1:
+                    m = _RATES_RE.match(text, idx)
                     if m:
                         # Convert Eastern Arabic numerals to Western if present
-                        num = m.group(1)
-                        # Replace Arabic-Indic digits with Western digits
-                        arabic_to_western = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
-                        num = num.translate(arabic_to_western)
-                        saudisation_rate = f"{num}%"
-                # Search for contract documentation phrase
-                idx_doc = text.find("معدل توثيق العقود")
-                if idx_doc != -1 and contract_doc_rate is None:
-                    window = text[idx_doc:idx_doc + 60]
-                    m = re.search(r"([0-9٠-٩]+)\s*%", window)
-                    if m:
-                        num = m.group(1)
-                        arabic_to_western = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
-                        num = num.translate(arabic_to_western)
-                        contract_doc_rate = f"{num}%"
+                        rate = f"{m.group('rate').translate(_AR2EN)}%"
+                        if m.group('saudisation'):
+                            if saudisation_rate is None:
+                                saudisation_rate = rate
+                        elif contract_doc_rate is None:
+                            contract_doc_rate = rate
+                    idx = text.find(_RATE_PREFIX, idx + len(_RATE_PREFIX))
+                if saudisation_rate and contract_doc_rate:
+                    break
         return saudisation_rate, contract_doc_rate
     except Exception:
         return None, None
 
 
+@st.cache_data(show_spinner=False)
+def _detect_employee_sheets(file_bytes: bytes) -> Tuple[Optional[str], Optional[str], Tuple]:
+    """Locate the contract and master sheets of the employee workbook.
+
+    The workbook is opened in openpyxl's streaming read-only mode and only the
+    header row of each worksheet is read, which is far cheaper than building a
+    DataFrame per sheet.  The scan stops as soon as both sheets have been found.
+
+    Parameters
+    ----------
+    file_bytes : bytes
+        The raw contents of the uploaded ``.xlsx`` file.
+
+    Returns
+    -------
+    tuple
+        ``(contract_sheet, master_sheet, contract_header)`` where the contract sheet
+        is the first one with a ``Contract Status`` column, the master sheet is the
+        first one with ``Nationality`` and ``Id number`` columns (either is ``None``
+        if not found), and ``contract_header`` is the contract sheet's header row.
+    """
+    contract_sheet: Optional[str] = None
+    master_sheet: Optional[str] = None
+    contract_header: Tuple = ()
+    # Imported lazily, like the PDF libraries: pandas only loads openpyxl on demand too
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            header = next(ws.iter_rows(max_row=1, values_only=True), ())
+            cols = set(header)
+            if 'Contract Status' in cols and contract_sheet is None:
+                contract_sheet, contract_header = ws.title, header
+            if {'Nationality', 'Id number'} <= cols and master_sheet is None:
+                master_sheet = ws.title
+            if contract_sheet is not None and master_sheet is not None:
+                break
+    finally:
+        wb.close()
+    return contract_sheet, master_sheet, contract_header
+
+
+@st.cache_data(show_spinner=False)
+def _load_excel(
+    file_bytes: bytes,
+    sheet_name: Union[str, int] = 0,
+    usecols: Optional[List[str]] = None,
+    dtype: Optional[Dict[str, str]] = None,
+) -> pd.DataFrame:
+    """Parse a single sheet of an uploaded workbook.
+
+    Streamlit reruns the whole script on every widget interaction, so the
+    parsed sheet is cached on the raw upload bytes and read options.  Reruns
+    with the same file return the cached DataFrame instead of re-parsing the XML.
+    Restricting ``usecols`` to the columns the dashboard needs keeps wide HR
+    exports from materialising cells that are never used.
+
+    Parameters
+    ----------
+    file_bytes : bytes
+        The raw contents of the uploaded ``.xlsx`` file.
+    sheet_name : str or int, optional
+        Sheet to read, by name or position.  Defaults to the first sheet.
+    usecols : list of str, optional
+        Column names to read.  Defaults to all columns.
+    dtype : dict, optional
+        Column dtypes passed through to :func:`pandas.read_excel`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The parsed sheet.
+    """
+    return pd.read_excel(
+        io.BytesIO(file_bytes),
+        sheet_name=sheet_name,
+        usecols=usecols,
+        dtype=dtype,
+        engine=EXCEL_ENGINE,
+    )
+
+
+@st.cache_data(show_spinner=False)
+def _extract_pdf_metrics(pdf_bytes: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """Cached wrapper around :func:`extract_pdf_metrics` keyed on the PDF bytes."""
+    return extract_pdf_metrics(io.BytesIO(pdf_bytes))
+
+
+@st.cache_data(show_spinner=False)
+def _make_status_pie(contract_data: pd.DataFrame) -> go.Figure:
+    """Build the contract status pie chart, cached on the aggregated counts."""
+    fig = px.pie(
+        contract_data,
+        names='status_label',
+        values='count',
+        hole=0.0,
+    )
+    fig.update_traces(textinfo='percent+label')
+    fig.update_layout(
+        title_text="Contract Status Distribution",
+        showlegend=True,
+        legend_title_text='',
+        font=dict(family="Arial", size=14),
+    )
+    return fig
+
+
+@st.cache_data(show_spinner=False)
+def _make_nationality_bar(nat_counts_df: pd.DataFrame) -> go.Figure:
+    """Build the nationality distribution bar chart, cached on the aggregated counts."""
+    fig = px.bar(
+        nat_counts_df,
+        x='nationality',
+        y='count',
+        labels={'nationality': 'Nationality', 'count': 'Number of Employees'},
+    )
+    fig.update_layout(
+        title_text="Nationality Distribution",
+        xaxis_title="Nationality",
+        yaxis_title="Number of Employees",
+        font=dict(family="Arial", size=14),
+    )
+    fig.update_traces(hovertemplate='%{x}: %{y}')
+    return fig
+
+
+def _summarise_workforce(emp_bytes: bytes, dep_bytes: bytes) -> Dict[str, Any]:
+    """Compute the workforce metrics from the employee and dependents workbooks.
+
+    Parameters
+    ----------
+    emp_bytes : bytes
+        The raw contents of the employee ``.xlsx`` file.
+    dep_bytes : bytes
+        The raw contents of the dependents ``.xlsx`` file.
+
+    Returns
+    -------
+    dict
+        ``num_fixed``, ``num_indefinite``, ``num_foreign`` and ``num_foreign_many_dep``
+        counts, plus the aggregated ``contract_data`` and ``nat_counts_df`` chart frames.
+
+    Raises
+    ------
+    WorkbookError
+        If the employee workbook lacks a required sheet or column.
+    """
+    # Read dependents data from the first sheet
+    dep_df = _load_excel(dep_bytes, usecols=['رقم إقامة رب الأسرة'])
+
+    # Read employee file headers and automatically detect relevant sheets
+    # Identify sheet containing 'Contract Status' and 'Nationality'
+    contract_sheet, master_sheet, contract_header = _detect_employee_sheets(emp_bytes)
+    if contract_sheet is None:
+        raise WorkbookError("لم يتم العثور على ورقة تحتوي على عمود 'Contract Status'. يرجى التحقق من ملف الموظفين.")
+    if master_sheet is None:
+        raise WorkbookError("لم يتم العثور على ورقة تحتوي على أعمدة 'Nationality' و 'Id number'. يرجى التحقق من ملف الموظفين.")
+
+    # Ensure 'Id number' exists in the contract sheet too, so employees can be matched to it
+    if 'Id number' not in contract_header:
+        raise WorkbookError("العمود 'Id number' غير موجود في إحدى أوراق الموظفين.")
+
+    # Load only the two sheets, and the columns, that are actually needed.  The
+    # low-cardinality text columns are converted to categoricals, so string work below
+    # touches each distinct value once and per-row work is on integer codes; ids keep
+    # numeric inference since they are converted to integers below.  The text columns
+    # are read as str (missing cells stay NaN) and converted after the read: a
+    # categorical built at parse time sorts the raw cell values, which raises TypeError
+    # when a stray numeric cell sits among the text.
+    contract_df = _load_excel(
+        emp_bytes, contract_sheet,
+        usecols=['Id number', 'Contract Status'],
+        dtype={'Contract Status': str},
+    )
+    contract_df['Contract Status'] = contract_df['Contract Status'].astype('category')
+    master_df = _load_excel(
+        emp_bytes, master_sheet,
+        usecols=['Id number', 'Nationality'],
+        dtype={'Nationality': str},
+    )
+    master_df['Nationality'] = master_df['Nationality'].astype('category')
+
+    # Normalize contract status values at the category level: strip surrounding spaces
+    # and drop blank placeholders, then recode the rows with one integer take.  Stripping
+    # can merge categories (e.g. 'محدد' and 'محدد '), so the codes are remapped rather
+    # than the categories renamed in place.
+    raw_status = contract_df['Contract Status']
+    stripped = raw_status.cat.categories.astype(str).str.strip()
+    categories = pd.Index(stripped.unique()).drop(['', 'nan', 'NaN'], errors='ignore')
+    recode = np.append(categories.get_indexer(stripped), -1)  # index -1 keeps missing rows missing
+    # A single bincount over the recoded status codes yields every status count: the
+    # headline metrics look up two of them and the pie chart uses the full set
+    codes = recode[raw_status.cat.codes.to_numpy()]
+    status_counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+    counts_by_status = dict(zip(categories, status_counts.tolist()))
+    num_fixed = counts_by_status.get('محدد', 0)
+    num_indefinite = counts_by_status.get('غير محدد', 0)
+
+    # Convert ids to numbers once.  Plain numpy dtypes are kept (int64, or float64 with
+    # NaN for unparseable ids) rather than nullable Int64, whose masked arrays take slower
+    # paths in isin/map; ids fit exactly in float64's 53-bit mantissa.
+    master_df['Id number'] = pd.to_numeric(master_df['Id number'], errors='coerce')
+    contract_df['Id number'] = pd.to_numeric(contract_df['Id number'], errors='coerce')
+
+    # Keep the master rows whose id appears in the contract sheet.  Contract counts come
+    # from contract_df above, so only id membership is needed here, not a per-row status.
+    contract_ids = contract_df['Id number'].dropna().unique()
+    emp_df = master_df.loc[master_df['Id number'].isin(contract_ids), ['Id number', 'Nationality']].copy()
+
+    # Store nationality as a categorical: the chart's value_counts then counts codes,
+    # and the Saudi check only normalises each distinct name once.  The mask is
+    # computed once and reused below; missing nationalities count as foreign.
+    nationality = emp_df['Nationality'].cat.remove_unused_categories()
+    emp_df['Nationality'] = nationality
+    names = nationality.cat.categories.astype(str).str.strip().str.casefold()
+    saudi_codes = np.flatnonzero(names == 'saudi arabia')
+    foreign_mask = ~np.isin(nationality.cat.codes.to_numpy(), saudi_codes)
+    num_foreign = int(foreign_mask.sum())
+
+    # Process dependents: parse head ids as numbers and keep the valid ones as a plain
+    # int64 array, never materialising a nullable Int64 column on the dependents frame
+    head_ids = pd.to_numeric(dep_df['رقم إقامة رب الأسرة'], errors='coerce').dropna().to_numpy(dtype='int64')
+
+    # Only foreign employees feed the many-dependents metric, so keep just the
+    # dependents whose head is a foreign employee before counting.  Count per head
+    # id in a single pass over the raw int64 array, then attach the counts with a
+    # lookup rather than a join (Saudi employees are therefore left at 0).
+    foreign_ids = emp_df.loc[foreign_mask, 'Id number'].dropna().to_numpy(dtype='int64')
+    head_ids = head_ids[np.isin(head_ids, foreign_ids)]
+    keys, counts = np.unique(head_ids, return_counts=True)
+    dep_counts = pd.Series(counts, index=keys)
+    emp_df['dependents'] = emp_df['Id number'].map(dep_counts).fillna(0).astype('int32')
+
+    # Only the count is displayed, so combine the masks on raw arrays instead of
+    # materialising the filtered DataFrame
+    num_foreign_many_dep = int(np.count_nonzero(foreign_mask & (emp_df['dependents'].to_numpy() > 4)))
+
+    # Aggregate the chart inputs here, once per upload: the summary is kept in
+    # session_state, so reruns (and re-opening the statistics expander) only hand these
+    # small frames to the cached figure builders instead of re-counting the columns
+    contract_data = pd.DataFrame({
+        'status': categories.astype(str),
+        'count': status_counts,
+    })
+    # Few distinct statuses: a plain dict lookup per label is cheaper than map + fillna
+    contract_data['status_label'] = [STATUS_MAP.get(s, s) for s in contract_data['status']]
+    # Chart only the most common nationalities and fold the long tail into one bar, which
+    # keeps the frame and the figure payload sent to the browser small
+    nat_counts = nationality.value_counts()
+    nat_counts_df = pd.DataFrame({
+        'nationality': nat_counts.index.astype(str)[:NATIONALITY_CHART_TOP_N],
+        'count': nat_counts.to_numpy()[:NATIONALITY_CHART_TOP_N],
+    })
+    if len(nat_counts) > NATIONALITY_CHART_TOP_N:
+        nat_counts_df.loc[len(nat_counts_df)] = ['Other', int(nat_counts.iloc[NATIONALITY_CHART_TOP_N:].sum())]
+
+    return {
+        'num_fixed': num_fixed,
+        'num_indefinite': num_indefinite,
+        'num_foreign': num_foreign,
+        'num_foreign_many_dep': num_foreign_many_dep,
+        'contract_data': contract_data,
+        'nat_counts_df': nat_counts_df,
+    }
+
+
 def main() -> None:
     """Run the Streamlit dashboard application."""
     st.set_page_config(page_title="لوحة مؤشرات الموارد البشرية", layout="wide")
@@ -156,8 +508,45 @@ def main() -> None:
     # New metric: wage protection compliance rate. This will always be entered manually
     wage_protection_rate: Optional[str] = None
 
-    if pdf_file is not None:
-        saudisation_rate, contract_doc_rate = extract_pdf_metrics(pdf_file)
+    # Parse the PDF in a background thread while the workbooks are processed: the two
+    # share no data, so the wall time becomes the slower of the two rather than their sum.
+    # The overlap relies on pypdfium2 releasing the GIL while PDFium extracts text (it
+    # calls the native library through ctypes); the pdfplumber fallback is pure Python
+    # and gets no overlap.  PDFium itself is not thread-safe, so _iter_pdf_text
+    # serialises its calls across sessions with _PDFIUM_LOCK.
+    # The worker thread gets this script's run context so the cached loader works there.
+    # Results are also kept in session_state, keyed by the ids Streamlit assigns to the
+    # uploads, so reruns with the same files skip even hashing the bytes for the caches.
+    summary: Optional[Dict[str, Any]] = None
+    data_error: Optional[str] = None
+    data_key = (emp_file.file_id, dep_file.file_id) if emp_file and dep_file else None
+    pdf_key = pdf_file.file_id if pdf_file is not None else None
+    data_cached = data_key is not None and st.session_state.get("summary_key") == data_key
+    pdf_cached = pdf_key is not None and st.session_state.get("pdf_key") == pdf_key
+    if data_cached:
+        summary = st.session_state["summary"]
+    if pdf_cached:
+        saudisation_rate, contract_doc_rate = st.session_state["pdf_rates"]
+    with ThreadPoolExecutor(
+        max_workers=1, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx())
+    ) as executor:
+        pdf_future = (
+            executor.submit(_extract_pdf_metrics, pdf_file.getvalue())
+            if pdf_key is not None and not pdf_cached else None
+        )
+        if data_key is not None and not data_cached:
+            try:
+                summary = _summarise_workforce(emp_file.getvalue(), dep_file.getvalue())
+                st.session_state["summary_key"] = data_key
+                st.session_state["summary"] = summary
+            except WorkbookError as exc:
+                data_error = str(exc)
+            except Exception as exc:
+                data_error = f"حدث خطأ أثناء معالجة البيانات: {exc}"
+        if pdf_future is not None:
+            saudisation_rate, contract_doc_rate = pdf_future.result()
+            st.session_state["pdf_key"] = pdf_key
+            st.session_state["pdf_rates"] = (saudisation_rate, contract_doc_rate)
 
     # If PDF extraction failed, allow manual input. We also include a field for the wage protection compliance rate.
     # The expander is open if any of the three rates are missing.
@@ -178,81 +567,22 @@ def main() -> None:
             help="أدخل الرقم فقط، سيتم عرضه مع مؤشرات الامتثال"
         )
 
-    if emp_file and dep_file:
+    if data_error is not None:
+        st.error(data_error)
+    elif summary is not None:
         try:
-            # Read dependents data from the first sheet
-            dep_xls = pd.ExcelFile(dep_file)
-            dep_df = pd.read_excel(dep_xls, sheet_name=dep_xls.sheet_names[0])
-
-            # Read employee file and automatically detect relevant sheets
-            emp_xls = pd.ExcelFile(emp_file)
-            contract_sheet = None
-            master_sheet = None
-            # Identify sheet containing 'Contract Status' and 'Nationality'
-            for sheet in emp_xls.sheet_names:
-                try:
-                    tmp_df = pd.read_excel(emp_xls, sheet_name=sheet, nrows=1)
-                except Exception:
-                    continue
-                cols = tmp_df.columns
-                if 'Contract Status' in cols and contract_sheet is None:
-                    contract_sheet = sheet
-                if 'Nationality' in cols and 'Id number' in cols and master_sheet is None:
-                    master_sheet = sheet
-            if contract_sheet is None:
-                st.error("لم يتم العثور على ورقة تحتوي على عمود 'Contract Status'. يرجى التحقق من ملف الموظفين.")
-                return
-            if master_sheet is None:
-                st.error("لم يتم العثور على ورقة تحتوي على أعمدة 'Nationality' و 'Id number'. يرجى التحقق من ملف الموظفين.")
-                return
-
-            # Load sheets fully
-            contract_df = pd.read_excel(emp_xls, sheet_name=contract_sheet)
-            master_df = pd.read_excel(emp_xls, sheet_name=master_sheet)
-
-            # Ensure the contract status column exists
-            if 'Contract Status' not in contract_df.columns:
-                st.error("العمود 'Contract Status' غير موجود في ورقة العقد.")
-                return
-            # Normalize contract status values: remove surrounding spaces and drop missing
-            contract_df['Contract Status'] = contract_df['Contract Status'].astype(str).str.strip()
-            contract_counts = contract_df['Contract Status'][
-                ~contract_df['Contract Status'].isin(['', 'nan', 'NaN'])
-            ].value_counts()
-
-            # Prepare for merging
-            # Ensure 'Id number' exists in both
-            if 'Id number' not in master_df.columns or 'Id number' not in contract_df.columns:
-                st.error("العمود 'Id number' غير موجود في إحدى أوراق الموظفين.")
-                return
-            master_df['Id number'] = master_df['Id number'].astype(str)
-            contract_df['Id number'] = contract_df['Id number'].astype(str)
-
-            # Merge nationality and contract status
-            emp_df = pd.merge(master_df[['Id number', 'Nationality']], contract_df[['Id number', 'Contract Status']], on='Id number', how='inner')
-
-            # Count foreign employees
-            foreign_emps = emp_df[emp_df['Nationality'].str.lower() != 'saudi arabia']
-            num_foreign = len(foreign_emps)
-
-            # Process dependents: convert to numeric for merge
-            dep_df['رقم إقامة رب الأسرة'] = pd.to_numeric(dep_df['رقم إقامة رب الأسرة'], errors='coerce').astype('Int64')
-            emp_df['Id number_int'] = pd.to_numeric(emp_df['Id number'], errors='coerce').astype('Int64')
-
-            # Group dependents count by head id
-            dep_counts = dep_df.groupby('رقم إقامة رب الأسرة').size().reset_index(name='dependents')
-            emp_merged = pd.merge(emp_df, dep_counts, left_on='Id number_int', right_on='رقم إقامة رب الأسرة', how='left')
-            emp_merged['dependents'] = emp_merged['dependents'].fillna(0)
-
-            foreign_with_many_dep = emp_merged[(emp_merged['Nationality'].str.lower() != 'saudi arabia') & (emp_merged['dependents'] > 4)]
+            num_fixed = summary['num_fixed']
+            num_indefinite = summary['num_indefinite']
+            num_foreign = summary['num_foreign']
+            num_foreign_many_dep = summary['num_foreign_many_dep']
 
             # Display metrics
             st.subheader("النتائج الرئيسية")
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("العقود محددة المدة", int(contract_counts.get('محدد', 0)))
-            col2.metric("العقود غير محددة المدة", int(contract_counts.get('غير محدد', 0)))
+            col1.metric("العقود محددة المدة", num_fixed)
+            col2.metric("العقود غير محددة المدة", num_indefinite)
             col3.metric("عدد الموظفين الأجانب", num_foreign)
-            col4.metric("عدد الأجانب مع أكثر من أربعة تابعين", len(foreign_with_many_dep))
+            col4.metric("عدد الأجانب مع أكثر من أربعة تابعين", num_foreign_many_dep)
 
             # Display compliance metrics, including wage protection compliance if provided
             with st.container():
@@ -281,49 +611,12 @@ def main() -> None:
 
                 # --- Contract status distribution (Pie) ---
                 st.subheader("توزيع حالة العقد")
-                contract_data = contract_counts.reset_index()
-                contract_data.columns = ['status', 'count']
-
-                # Map Arabic statuses to English for chart labels
-                STATUS_MAP = {
-                    'محدد': 'Limited',
-                    'غير محدد': 'Unlimited'
-                }
-                contract_data['status_label'] = contract_data['status'].map(STATUS_MAP).fillna(contract_data['status'])
-
-                fig1 = px.pie(
-                    contract_data,
-                    names='status_label',
-                    values='count',
-                    hole=0.0,
-                )
-                fig1.update_traces(textinfo='percent+label')
-                fig1.update_layout(
-                    title_text="Contract Status Distribution",
-                    showlegend=True,
-                    legend_title_text='',
-                    font=dict(family="Arial", size=14),
-                )
+                fig1 = _make_status_pie(summary['contract_data'])
                 st.plotly_chart(fig1, use_container_width=True)
 
                 # --- Nationality distribution (Bar) ---
                 st.subheader("توزيع الجنسيات")
-                nat_counts_df = emp_df['Nationality'].value_counts().reset_index()
-                nat_counts_df.columns = ['nationality', 'count']
-
-                fig2 = px.bar(
-                    nat_counts_df,
-                    x='nationality',
-                    y='count',
-                    labels={'nationality': 'Nationality', 'count': 'Number of Employees'},
-                )
-                fig2.update_layout(
-                    title_text="Nationality Distribution",
-                    xaxis_title="Nationality",
-                    yaxis_title="Number of Employees",
-                    font=dict(family="Arial", size=14),
-                )
-                fig2.update_traces(hovertemplate='%{x}: %{y}')
+                fig2 = _make_nationality_bar(summary['nat_counts_df'])
                 st.plotly_chart(fig2, use_container_width=True)
 
 